@@ -0,0 +1,86 @@
+"""Бенчмарк /edit: время исправления анкеты не должно зависеть от размера таблицы.
+
+Пример:
+    python bench_edit.py --sizes 1000 10000 100000 --edits 200
+
+Для каждого размера таблица на фейковом Google Sheets (replay.py) заполняется
+анкетами, индекс строится одним чтением колонки ID, затем измеряется время
+и число запросов к API на одно исправление вердикта (колонка из кэша аналитики,
+поэтому учитывается и обновление кэша) и время итоговой записи кэша на диск.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from main import AnalyticsCache, InterviewBot, SUBMISSION_ID_COLUMN
+from replay import FakeSheetsService, RecordedLatencies
+
+
+class CountingSheetsService(FakeSheetsService):
+    """Фейковый Google Sheets со счетчиком запросов"""
+
+    def __init__(self, latencies):
+        super().__init__(latencies)
+        self.calls = 0
+
+    def get(self, *args, **kwargs):
+        self.calls += 1
+        return super().get(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        self.calls += 1
+        return super().update(*args, **kwargs)
+
+
+async def bench(size, edits):
+    sheets = CountingSheetsService(RecordedLatencies())
+    id_index = ord(SUBMISSION_ID_COLUMN) - ord('A')
+    ids = [f"{i:08x}" for i in range(size)]
+    for submission_id in ids:
+        row = [''] * (id_index + 1)
+        row[0] = 'ФИО'
+        row[7] = 'Да'
+        row[id_index] = submission_id
+        sheets.rows.append(row)
+
+    bot = InterviewBot('0:bench', sheet_service=sheets)
+    bot.analytics = AnalyticsCache(os.path.join(tempfile.mkdtemp(prefix='bench_'), 'analytics_cache.bin'))
+
+    started = time.perf_counter()
+    await bot.rebuild_row_index()
+    await bot.sync_analytics()
+    rebuild_ms = (time.perf_counter() - started) * 1000
+
+    sheets.calls = 0
+    targets = random.sample(ids, min(edits, size))
+    started = time.perf_counter()
+    for i, submission_id in enumerate(targets):
+        await bot.edit_submission(submission_id, 'verdict', 'Нет' if i % 2 else 'Да')
+    per_edit_ms = (time.perf_counter() - started) * 1000 / len(targets)
+
+    started = time.perf_counter()
+    await bot.flush_analytics()
+    flush_ms = (time.perf_counter() - started) * 1000
+
+    print(
+        f"rows={size:>7}  rebuild={rebuild_ms:8.1f} ms  "
+        f"edit={per_edit_ms:6.3f} ms  api_calls/edit={sheets.calls / len(targets):.1f}  "
+        f"cache_flush={flush_ms:6.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк /edit")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--edits', type=int, default=200)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        asyncio.run(bench(size, args.edits))
+
+
+if __name__ == '__main__':
+    main()
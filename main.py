@@ -4,9 +4,21 @@ import sys
 import signal
 import json
 import time
+import asyncio
+import hashlib
+import secrets
+import struct
+import uuid
+from array import array
+from collections import Counter, deque
 from datetime import datetime
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from telegram.ext import (
+    Application, ApplicationHandlerStop, CommandHandler, MessageHandler, TypeHandler,
+    PicklePersistence, filters, ContextTypes, ConversationHandler
+)
+from telegram.error import RetryAfter, NetworkError, TelegramError
+from telegram.request import HTTPXRequest
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
@@ -29,12 +41,615 @@ logger = logging.getLogger(__name__)
 SPREADSHEET_ID = "1JvUD3CSFdgtsUVqir6zUfB5oC42NtP4YGOlZOVNRLho"
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
+# Сколько секунд ждать завершения начатых записей при остановке (SIGTERM от Railway)
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', '20'))
+
+# Файл с незаконченными анкетами (user_data и состояние разговора) между перезапусками.
+# В Railway файловая система пересоздается при деплое: укажите путь на подключенном Volume
+PERSISTENCE_FILE = os.environ.get('PERSISTENCE_FILE', 'bot_persistence.pickle')
+
+# Локальный колоночный кэш результатов для /analytics
+ANALYTICS_CACHE_FILE = os.environ.get('ANALYTICS_CACHE_FILE', 'analytics_cache.bin')
+# Задержка записи кэша на диск после изменений (сек): правки подряд сохраняются одной записью
+ANALYTICS_SAVE_DELAY = float(os.environ.get('ANALYTICS_SAVE_DELAY', '5'))
+
+# Колонки кэша: по одной категориальной колонке на ответ анкеты
+ANALYTICS_COLUMNS = [
+    'interviewer', 'canonical_obstacles', 'spiritual_guide',
+    'impressions_1', 'impressions_2', 'impressions_3',
+    'impressions_4', 'impressions_5', 'impressions_6',
+    'verdict'
+]
+
+# Короткие имена колонок для команды /analytics
+ANALYTICS_ALIASES = {
+    'interviewer': 'interviewer',
+    'obstacles': 'canonical_obstacles',
+    'guide': 'spiritual_guide',
+    'imp1': 'impressions_1',
+    'imp2': 'impressions_2',
+    'imp3': 'impressions_3',
+    'imp4': 'impressions_4',
+    'imp5': 'impressions_5',
+    'imp6': 'impressions_6',
+    'verdict': 'verdict',
+}
+
+# Варианты ответов шагов 5-10: нужны, чтобы разобрать склеенную колонку E таблицы
+IMPRESSIONS_OPTIONS = {
+    'impressions_1': ['Общительный, открытый', 'Замкнутый', 'Слишком общительный'],
+    'impressions_2': ['Давно в церкви', 'Недавно в церкви'],
+    'impressions_3': ['Из церковной семьи', 'Из не церковной семьи'],
+    'impressions_4': ['Помогает в храме', 'Ничем не занят в храме'],
+    'impressions_5': ['Жена из церковной семьи', 'Жена из не церковной семьи', 'Не женат'],
+    'impressions_6': ['Состоявшийся мужчина', 'Вполне зрелый', 'Совсем еще не зрелый'],
+}
+
+
+# Заголовки таблицы (A:Q). Колонка E - впечатления одной строкой для чтения,
+# L:Q - те же ответы шагов 5-10 по отдельности (включая "Затрудняюсь ответить")
+SHEET_HEADERS = [
+    "ФИО абитуриента", "Собеседующий", "Канонические препятствия",
+    "Духовник", "Впечатления", "Проблемы в учебе",
+    "Комментарии", "Вердикт", "Дата", "ID анкеты", "Telegram ID собеседующего",
+    "Общение", "Давно ли в церкви", "Семья", "Помощь в храме",
+    "Семейное положение", "Зрелость"
+]
+SHEET_LAST_COLUMN = chr(ord('A') + len(SHEET_HEADERS) - 1)
+IMPRESSIONS_FIRST_INDEX = 11  # колонка L
+
+
+class AnalyticsCache:
+    """Колоночный кэш результатов собеседований.
+    
+    Каждая колонка хранится как array('I') с кодами категорий и словарем
+    код -> значение, поэтому группировка по 100k+ строк занимает миллисекунды.
+    Для каждой строки кэша хранится номер строки таблицы (sheet_rows), поэтому
+    пропуски и перезаписи в таблице не сдвигают соответствие.
+    synced_rows - сколько строк данных таблицы уже учтено, при запуске
+    дочитываются только новые строки.
+    """
+    
+    MAGIC = b'IBAC3\n'
+    
+    def __init__(self, filename=ANALYTICS_CACHE_FILE):
+        self.filename = filename
+        self.synced_rows = 0
+        self.categories = {col: [''] for col in ANALYTICS_COLUMNS}
+        self._codes = {col: {'': 0} for col in ANALYTICS_COLUMNS}
+        self.columns = {col: array('I') for col in ANALYTICS_COLUMNS}
+        self.sheet_rows = array('I')
+        self._positions = {}  # номер строки таблицы -> позиция в кэше
+    
+    def __len__(self):
+        return len(self.sheet_rows)
+    
+    def _code(self, col, value):
+        value = '' if value is None else str(value)
+        codes = self._codes[col]
+        code = codes.get(value)
+        if code is None:
+            code = len(self.categories[col])
+            codes[value] = code
+            self.categories[col].append(value)
+        return code
+    
+    def append(self, data, sheet_row):
+        """Добавление анкеты из строки sheet_row таблицы (перезапись, если строка уже есть)"""
+        # Сначала кодируем всю строку, чтобы колонки не разъехались при ошибке
+        codes = [(col, self._code(col, data.get(col))) for col in ANALYTICS_COLUMNS]
+        position = self._positions.get(sheet_row)
+        if position is not None:
+            for col, code in codes:
+                self.columns[col][position] = code
+        else:
+            for col, code in codes:
+                self.columns[col].append(code)
+            self._positions[sheet_row] = len(self.sheet_rows)
+            self.sheet_rows.append(sheet_row)
+        
+        # synced_rows растет только по непрерывному диапазону: строки, вставленные
+        # в таблицу вручную (например, из backup_data.json), дочитает sync_analytics
+        if sheet_row == self.synced_rows + 2:
+            self.synced_rows += 1
+    
+    @staticmethod
+    def row_to_data(row):
+        """Преобразование строки таблицы (A:Q) в словарь анкеты"""
+        row = list(row) + [''] * (len(SHEET_HEADERS) - len(row))
+        data = {
+            'interviewer': row[1],
+            'canonical_obstacles': row[2],
+            'spiritual_guide': row[3],
+            'verdict': row[7],
+        }
+        impressions = row[IMPRESSIONS_FIRST_INDEX:IMPRESSIONS_FIRST_INDEX + 6]
+        if any(impressions):
+            # Ответы шагов 5-10 в отдельных колонках, как есть
+            for i, value in enumerate(impressions, start=1):
+                data[f'impressions_{i}'] = value
+            return data
+        
+        # Старые строки: ответы есть только в склеенной колонке E
+        for part in row[4].split('; ') if row[4] else []:
+            for key, options in IMPRESSIONS_OPTIONS.items():
+                if part in options:
+                    data[key] = part
+                    break
+        return data
+    
+    def append_rows(self, rows, first_row=None):
+        """Дочитывание новых строк таблицы, начиная со строки first_row.
+        
+        Пустые строки (без ФИО) пропускаются, но учитываются в synced_rows.
+        """
+        if first_row is None:
+            first_row = self.synced_rows + 2  # строка 1 - заголовки
+        for sheet_row, row in enumerate(rows, start=first_row):
+            if row and str(row[0]).strip():
+                self.append(self.row_to_data(row), sheet_row)
+        self.synced_rows = max(self.synced_rows, first_row - 2 + len(rows))
+    
+    def set_value(self, sheet_row, col, value):
+        """Замена значения в строке таблицы sheet_row (после /edit); False, если строки нет в кэше"""
+        position = self._positions.get(sheet_row)
+        if position is None:
+            return False
+        self.columns[col][position] = self._code(col, value)
+        return True
+    
+    def group_by(self, *cols):
+        """Подсчет строк по сочетаниям значений колонок: {(значение, ...): количество}"""
+        counts = Counter(zip(*(self.columns[col] for col in cols)))
+        categories = [self.categories[col] for col in cols]
+        return {
+            tuple(cats[code] for cats, code in zip(categories, key)): count
+            for key, count in counts.items()
+        }
+    
+    def dump(self):
+        """Сериализация кэша в байты (заголовок JSON + сырые массивы)"""
+        header = json.dumps({
+            'synced_rows': self.synced_rows,
+            'rows': len(self),
+            'categories': self.categories,
+        }, ensure_ascii=False).encode('utf-8')
+        parts = [self.MAGIC, header, b'\n']
+        parts.append(self.sheet_rows.tobytes())
+        parts.extend(self.columns[col].tobytes() for col in ANALYTICS_COLUMNS)
+        return b''.join(parts)
+    
+    def save(self, payload=None):
+        """Атомарная запись кэша на диск"""
+        if payload is None:
+            payload = self.dump()
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_filename, self.filename)
+    
+    def load(self):
+        """Загрузка кэша с диска; при ошибке кэш остается пустым"""
+        if not os.path.exists(self.filename):
+            return False
+        
+        try:
+            with open(self.filename, 'rb') as f:
+                if f.readline() != self.MAGIC:
+                    raise ValueError("неизвестный формат файла")
+                header = json.loads(f.readline().decode('utf-8'))
+                rows = header['rows']
+                sheet_rows = array('I')
+                sheet_rows.fromfile(f, rows)
+                columns = {}
+                for col in ANALYTICS_COLUMNS:
+                    column = array('I')
+                    column.fromfile(f, rows)
+                    columns[col] = column
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки кэша аналитики: {e}")
+            return False
+        
+        self.synced_rows = header['synced_rows']
+        self.categories = {col: header['categories'][col] for col in ANALYTICS_COLUMNS}
+        self._codes = {
+            col: {value: code for code, value in enumerate(values)}
+            for col, values in self.categories.items()
+        }
+        self.columns = columns
+        self.sheet_rows = sheet_rows
+        self._positions = {sheet_row: position for position, sheet_row in enumerate(sheet_rows)}
+        return True
+
+
+# Запись трафика для последующего воспроизведения (replay.py); пусто - запись выключена
+RECORD_FILE = os.environ.get('RECORD_FILE', '')
+
+
+class TrafficRecorder:
+    """Запись обновлений и времени обращений к бэкендам в компактный бинарный лог.
+    
+    Формат: заголовок MAGIC, затем записи struct RECORD_HEADER
+    (тип, секунды от начала записи, длина) и JSON-тело.
+    Из обновления сохраняются только поля из белого списка (MESSAGE_KEYS,
+    USER_KEYS, CHAT_KEYS, ENTITY_KEYS), все остальное (подписи, контакты,
+    пересылки, файлы) отбрасывается. Идентификаторы пользователей и чатов
+    хешируются с солью, имена стираются, свободный текст заменяется заглушкой;
+    сохраняются только имена команд (без аргументов) и тексты кнопок, которые
+    бот предлагал в клавиатурах. Существующий файл никогда не перезаписывается.
+    """
+    
+    MAGIC = b'IBRR1\n'
+    RECORD_HEADER = struct.Struct('<BdI')
+    
+    UPDATE = 1
+    SHEETS_CALL = 2
+    BOT_API_CALL = 3
+    
+    # Белый список полей; остальные поля обновления в запись не попадают
+    MESSAGE_FIELDS = ('message', 'edited_message')
+    MESSAGE_KEYS = ('message_id', 'date', 'edit_date')
+    USER_KEYS = ('is_bot',)
+    CHAT_KEYS = ('type',)
+    ENTITY_KEYS = ('type', 'offset', 'length')
+    
+    def __init__(self, filename):
+        self.filename = filename
+        self._salt = secrets.token_bytes(16)
+        self._started = time.monotonic()
+        self._known_texts = set()
+        # 'x': запись прошлого инцидента не должна затереться при перезапуске
+        self._file = open(filename, 'xb')
+        self._file.write(self.MAGIC)
+        self._file.flush()
+    
+    @staticmethod
+    def unique_filename(base):
+        """Имя файла записи с временем запуска и PID: traffic.bin -> traffic-20261019-120000-42.bin"""
+        root, ext = os.path.splitext(base)
+        return f"{root}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}{ext}"
+    
+    def _write(self, kind, payload):
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        offset = time.monotonic() - self._started
+        self._file.write(self.RECORD_HEADER.pack(kind, offset, len(body)) + body)
+        self._file.flush()
+    
+    def _hash_id(self, value):
+        digest = hashlib.blake2b(str(value).encode(), key=self._salt, digest_size=6).digest()
+        return int.from_bytes(digest, 'big')
+    
+    def _mask_text(self, text):
+        if text.startswith('/'):
+            # Аргументы команд (например, /edit ... fio Иванов) - личные данные
+            command, sep, args = text.partition(' ')
+            return command + sep + 'x' * len(args)
+        if text in self._known_texts:
+            return text
+        return 'x' * len(text)
+    
+    def _anonymize_message(self, message):
+        result = {k: message[k] for k in self.MESSAGE_KEYS if k in message}
+        sender = message.get('from')
+        if isinstance(sender, dict):
+            # Пустое имя вместо удаления: first_name обязателен для User.de_json
+            result['from'] = {'id': self._hash_id(sender.get('id')), 'first_name': ''}
+            result['from'].update({k: sender[k] for k in self.USER_KEYS if k in sender})
+        chat = message.get('chat')
+        if isinstance(chat, dict):
+            result['chat'] = {'id': self._hash_id(chat.get('id'))}
+            result['chat'].update({k: chat[k] for k in self.CHAT_KEYS if k in chat})
+        if isinstance(message.get('text'), str):
+            result['text'] = self._mask_text(message['text'])
+            if 'entities' in message:
+                result['entities'] = [
+                    {k: entity[k] for k in self.ENTITY_KEYS if k in entity}
+                    for entity in message['entities']
+                ]
+        return result
+    
+    def _anonymize(self, update_data):
+        result = {'update_id': update_data.get('update_id')}
+        for field in self.MESSAGE_FIELDS:
+            if isinstance(update_data.get(field), dict):
+                result[field] = self._anonymize_message(update_data[field])
+        return result
+    
+    def remember_keyboard(self, reply_markup):
+        """Запоминание текстов кнопок, чтобы не скрывать их в записанных ответах"""
+        if isinstance(reply_markup, str):
+            try:
+                reply_markup = json.loads(reply_markup)
+            except ValueError:
+                return
+        if not isinstance(reply_markup, dict):
+            return
+        for row in reply_markup.get('keyboard', []):
+            for button in row:
+                text = button.get('text') if isinstance(button, dict) else button
+                if text:
+                    self._known_texts.add(text)
+    
+    def record_update(self, update_data):
+        self._write(self.UPDATE, self._anonymize(update_data))
+    
+    def record_sheets_call(self, method, duration):
+        self._write(self.SHEETS_CALL, {'method': method, 'duration': duration})
+    
+    def record_bot_api_call(self, endpoint, duration):
+        self._write(self.BOT_API_CALL, {'endpoint': endpoint, 'duration': duration})
+    
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+    
+    @classmethod
+    def read(cls, filename):
+        """Чтение лога: генератор (тип, смещение, данные)"""
+        with open(filename, 'rb') as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f"{filename}: неизвестный формат лога")
+            while True:
+                header = f.read(cls.RECORD_HEADER.size)
+                if len(header) < cls.RECORD_HEADER.size:
+                    return
+                kind, offset, length = cls.RECORD_HEADER.unpack(header)
+                body = f.read(length)
+                if len(body) < length:
+                    # Оборванная последняя запись (процесс был убит)
+                    return
+                yield kind, offset, json.loads(body.decode('utf-8'))
+
+
+class RecordingRequest(HTTPXRequest):
+    """HTTP-клиент Bot API, записывающий время запросов в TrafficRecorder"""
+    
+    def __init__(self, recorder, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recorder = recorder
+    
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        if request_data is not None:
+            self.recorder.remember_keyboard(request_data.parameters.get('reply_markup'))
+        
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+        finally:
+            self.recorder.record_bot_api_call(url.rsplit('/', 1)[-1], time.perf_counter() - started)
+
+
+# Уведомления проверяющим: JSON вида {"поле": {"ответ": [chat_id, ...]}}, например
+# {"verdict": {"Надо посоветоваться": [-100123]},
+#  "canonical_obstacles": {"Надо посоветоваться с проректором": [456]}}
+NOTIFY_ROUTES = os.environ.get('NOTIFY_ROUTES', '')
+
+# Лимиты Telegram: ~30 сообщений/сек всего, 1 сообщение/сек в личный чат, 20/мин в группу
+NOTIFY_GLOBAL_RATE = 25
+NOTIFY_PRIVATE_INTERVAL = 1.0
+NOTIFY_GROUP_INTERVAL = 3.0
+NOTIFY_MAX_MESSAGE_LENGTH = 4000
+
+NOTIFY_FIELD_NAMES = {
+    'verdict': 'Вердикт',
+    'canonical_obstacles': 'Канонические препятствия',
+    'spiritual_guide': 'Духовник',
+}
+
+
+def load_notify_routes(raw=NOTIFY_ROUTES):
+    """Разбор NOTIFY_ROUTES; при ошибке уведомления отключаются"""
+    if not raw:
+        return {}
+    try:
+        routes = json.loads(raw)
+        return {
+            field: {answer: [int(chat_id) for chat_id in chats] for answer, chats in answers.items()}
+            for field, answers in routes.items()
+        }
+    except Exception as e:
+        logger.error(f"❌ Ошибка разбора NOTIFY_ROUTES: {e}")
+        return {}
+
+
+class NotificationQueue:
+    """Очередь исходящих уведомлений с учетом лимитов Telegram.
+    
+    enqueue() не блокирует и не ждет отправки. Фоновая задача отправляет
+    сообщения не чаще лимита на чат и общего лимита; все, что накопилось
+    для чата за время ожидания, уходит одним сообщением-сводкой.
+    На 429 (RetryAfter) чат откладывается на указанное Telegram время.
+    """
+    
+    def __init__(self, bot, global_rate=NOTIFY_GLOBAL_RATE):
+        self.bot = bot
+        self.global_rate = global_rate
+        self._pending = {}  # chat_id -> [текст, ...]
+        self._next_allowed = {}  # chat_id -> time.monotonic()
+        self._sent_times = deque()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task = None
+    
+    def __len__(self):
+        return sum(len(texts) for texts in self._pending.values())
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    def enqueue(self, chat_id, text):
+        if self._closing and (self._task is None or self._task.done()):
+            logger.warning(f"⚠️  Очередь уведомлений остановлена, уведомление в {chat_id} не отправлено")
+            return
+        self._pending.setdefault(chat_id, []).append(text)
+        self._wakeup.set()
+    
+    async def stop(self, timeout):
+        """Отправка оставшихся уведомлений с дедлайном"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️  Не отправлено уведомлений: {len(self)}")
+            self._task.cancel()
+    
+    async def _wait(self, timeout=None):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _run(self):
+        while True:
+            if not self._pending:
+                if self._closing:
+                    return
+                await self._wait()
+                continue
+            
+            try:
+                await self._run_once()
+            except Exception as e:
+                # Фоновая задача не должна умирать молча, иначе очередь растет бесконечно
+                logger.error(f"❌ Ошибка в очереди уведомлений: {e}", exc_info=True)
+                await asyncio.sleep(1.0)
+    
+    async def _run_once(self):
+        now = time.monotonic()
+        ready = [chat_id for chat_id in self._pending if self._next_allowed.get(chat_id, 0) <= now]
+        if not ready:
+            await self._wait(min(self._next_allowed[chat_id] for chat_id in self._pending) - now)
+            return
+        
+        for chat_id in ready:
+            await self._global_slot()
+            await self._send(chat_id, self._pending.pop(chat_id))
+    
+    async def _global_slot(self):
+        """Ожидание, пока общий лимит сообщений в секунду не позволит отправку"""
+        while True:
+            now = time.monotonic()
+            while self._sent_times and now - self._sent_times[0] >= 1.0:
+                self._sent_times.popleft()
+            if len(self._sent_times) < self.global_rate:
+                self._sent_times.append(now)
+                return
+            await asyncio.sleep(1.0 - (now - self._sent_times[0]))
+    
+    def _requeue(self, chat_id, texts, delay):
+        self._pending[chat_id] = texts + self._pending.get(chat_id, [])
+        self._next_allowed[chat_id] = time.monotonic() + delay
+    
+    async def _send(self, chat_id, texts):
+        # Сводка из стольких уведомлений, сколько помещается в одно сообщение
+        batch = [texts[0][:NOTIFY_MAX_MESSAGE_LENGTH]]
+        length = len(batch[0])
+        for text in texts[1:]:
+            length += len(text) + 2
+            if length > NOTIFY_MAX_MESSAGE_LENGTH:
+                break
+            batch.append(text)
+        rest = texts[len(batch):]
+        
+        if len(batch) == 1:
+            message = batch[0]
+        else:
+            message = f"📬 Сводка: {len(batch)} уведомлений\n\n" + "\n\n".join(batch)
+        
+        interval = NOTIFY_GROUP_INTERVAL if chat_id < 0 else NOTIFY_PRIVATE_INTERVAL
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=message)
+        except RetryAfter as e:
+            logger.warning(f"⚠️  Лимит Telegram для чата {chat_id}, жду {e.retry_after} сек")
+            self._requeue(chat_id, texts, float(e.retry_after))
+            return
+        except NetworkError as e:
+            logger.warning(f"⚠️  Сетевая ошибка при отправке уведомления в {chat_id}: {e}")
+            self._requeue(chat_id, texts, 5.0)
+            return
+        except TelegramError as e:
+            logger.error(f"❌ Уведомление в чат {chat_id} не отправлено: {e}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки уведомления в {chat_id}: {e}", exc_info=True)
+            self._requeue(chat_id, texts, 5.0)
+            return
+        
+        if rest:
+            self._requeue(chat_id, rest, interval)
+        else:
+            self._next_allowed[chat_id] = time.monotonic() + interval
+
+
+# Колонки таблицы с ID анкеты и Telegram ID собеседующего (для /edit)
+SUBMISSION_ID_COLUMN = 'J'
+SUBMITTER_ID_COLUMN = 'K'
+
+# Telegram ID администраторов через запятую, например ADMIN_IDS=12345,67890.
+# Администраторам доступны /analytics и /edit любой анкеты. Если переменная
+# не задана, /analytics не доступна никому, а /edit - только авторам анкет.
+ADMIN_IDS = os.environ.get('ADMIN_IDS', '')
+
+
+def load_admin_ids(raw=ADMIN_IDS):
+    """Разбор ADMIN_IDS; при ошибке администраторов нет"""
+    try:
+        return {int(part) for part in raw.replace(' ', '').split(',') if part}
+    except ValueError as e:
+        logger.error(f"❌ Ошибка разбора ADMIN_IDS: {e}")
+        return set()
+
+# Поля, доступные для /edit: короткое имя -> (колонка таблицы, ключ анкеты)
+EDIT_FIELDS = {
+    'fio': ('A', 'fio'),
+    'interviewer': ('B', 'interviewer'),
+    'obstacles': ('C', 'canonical_obstacles'),
+    'guide': ('D', 'spiritual_guide'),
+    'problems': ('F', 'problems'),
+    'comments': ('G', 'comments'),
+    'verdict': ('H', 'verdict'),
+}
+
+
 class InterviewBot:
-    def __init__(self, token):
+    def __init__(self, token, sheet_service=None, recorder=None):
         self.token = token
         self.sheet_service = None
         self.google_connected = False
-        self.setup_google_sheets()
+        if recorder is None and RECORD_FILE:
+            recorder = TrafficRecorder(TrafficRecorder.unique_filename(RECORD_FILE))
+            logger.info(f"🎙 Запись трафика включена: {recorder.filename}")
+        self.recorder = recorder
+        self.shutting_down = False
+        self.shutdown_timeout = SHUTDOWN_DRAIN_TIMEOUT
+        # Незавершенные записи: задача -> данные анкеты
+        self._pending_writes = {}
+        # Дедлайн остановки истек: оставшиеся анкеты уже сохранены локально
+        self._drain_expired = asyncio.Event()
+        # Запись в таблицу по одной: анкеты попадают в таблицу в порядке завершения
+        self._sheet_lock = asyncio.Lock()
+        self.notify_routes = load_notify_routes()
+        self.notifier = None
+        # ID анкеты -> (номер строки в таблице, Telegram ID собеседующего)
+        self.row_index = {}
+        self._row_ids = {}  # номер строки -> ID анкеты (обратный индекс)
+        self.admin_ids = load_admin_ids()
+        self.analytics = AnalyticsCache()
+        self.analytics.load()
+        # Отложенная запись кэша аналитики (schedule_analytics_save)
+        self._analytics_dirty = False
+        self._analytics_save_task = None
+        self._analytics_save_now = asyncio.Event()
+        
+        if sheet_service is not None:
+            # Готовый сервис (например, фейковый при воспроизведении трафика)
+            self.sheet_service = sheet_service
+            self.google_connected = True
+        else:
+            self.setup_google_sheets()
     
     def setup_google_sheets(self):
         """Настройка подключения к Google Sheets через Google API"""
@@ -91,12 +706,20 @@ class InterviewBot:
                 # Проверяем, есть ли заголовки
                 result = self.sheet_service.spreadsheets().values().get(
                     spreadsheetId=SPREADSHEET_ID,
-                    range='A1:I1'
+                    range=f'A1:{SHEET_LAST_COLUMN}1'
                 ).execute()
                 
                 headers = result.get('values', [])
                 if headers:
                     logger.info(f"✅ Заголовки таблицы: {headers[0]}")
+                    if len(headers[0]) < len(SHEET_HEADERS):
+                        # Таблица создана до появления колонок J:Q
+                        self.sheet_service.spreadsheets().values().update(
+                            spreadsheetId=SPREADSHEET_ID,
+                            range=f'{SUBMISSION_ID_COLUMN}1:{SHEET_LAST_COLUMN}1',
+                            valueInputOption='RAW',
+                            body={'values': [SHEET_HEADERS[9:]]}
+                        ).execute()
                 else:
                     # Создаем заголовки если их нет
                     logger.info("📝 Создаю заголовки таблицы...")
@@ -129,11 +752,7 @@ class InterviewBot:
     def _create_headers(self):
         """Создание заголовков таблицы"""
         try:
-            headers = [
-                ["ФИО абитуриента", "Собеседующий", "Канонические препятствия",
-                 "Духовник", "Впечатления", "Проблемы в учебе",
-                 "Комментарии", "Вердикт", "Дата"]
-            ]
+            headers = [SHEET_HEADERS]
             
             body = {
                 'values': headers
@@ -141,7 +760,7 @@ class InterviewBot:
             
             self.sheet_service.spreadsheets().values().update(
                 spreadsheetId=SPREADSHEET_ID,
-                range='A1:I1',
+                range=f'A1:{SHEET_LAST_COLUMN}1',
                 valueInputOption='RAW',
                 body=body
             ).execute()
@@ -153,6 +772,325 @@ class InterviewBot:
             logger.error(f"❌ Ошибка создания заголовков: {e}")
             return False
     
+    async def _execute(self, request):
+        """Выполнение запроса Google API в отдельном потоке, чтобы не блокировать event loop"""
+        if self.recorder is None:
+            return await asyncio.to_thread(request.execute)
+        
+        started = time.perf_counter()
+        try:
+            return await asyncio.to_thread(request.execute)
+        finally:
+            self.recorder.record_sheets_call(
+                getattr(request, 'methodId', 'unknown'),
+                time.perf_counter() - started
+            )
+    
+    async def save_submission(self, data):
+        """Сохранение анкеты с учетом graceful shutdown.
+        
+        Запись запускается отдельной задачей и регистрируется в _pending_writes,
+        чтобы при остановке бота ее можно было дождаться (или сохранить локально).
+        """
+        # save_to_sheet дописывает в payload номер строки (sheet_row)
+        payload = dict(data)
+        task = asyncio.ensure_future(self._save_serialized(payload))
+        self._pending_writes[task] = dict(data)
+        task.add_done_callback(lambda t: self._pending_writes.pop(t, None))
+        
+        expired = asyncio.ensure_future(self._drain_expired.wait())
+        try:
+            await asyncio.wait({task, expired}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            expired.cancel()
+        
+        if not task.done():
+            # Дедлайн остановки истек, данные сохранены локально в drain_pending_writes
+            return False
+        success = task.result()
+        
+        if success:
+            # Кэш повторяет таблицу, поэтому учитываем только записанные в нее анкеты
+            await self.update_analytics(payload)
+        return success
+    
+    async def _save_serialized(self, data):
+        """Запись анкеты под блокировкой, чтобы параллельные записи не заняли одну строку"""
+        async with self._sheet_lock:
+            if self._drain_expired.is_set():
+                # Не начинаем запись после дедлайна: анкета уже в backup_data.json
+                return False
+            return await self.save_to_sheet(data)
+    
+    async def sync_analytics(self):
+        """Дочитывание в кэш аналитики строк таблицы, добавленных с прошлого запуска"""
+        if not self.google_connected or not self.sheet_service:
+            return False
+        
+        try:
+            first_row = self.analytics.synced_rows + 2  # строка 1 - заголовки
+            result = await self._execute(self.sheet_service.spreadsheets().values().get(
+                spreadsheetId=SPREADSHEET_ID,
+                range=f'A{first_row}:{SHEET_LAST_COLUMN}'
+            ))
+            rows = result.get('values', [])
+            if rows:
+                before = len(self.analytics)
+                self.analytics.append_rows(rows, first_row)
+                await asyncio.to_thread(self.analytics.save, self.analytics.dump())
+                logger.info(f"📊 Новых строк в кэше аналитики: {len(self.analytics) - before}")
+            logger.info(f"📊 Кэш аналитики: {len(self.analytics)} строк")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка синхронизации кэша аналитики: {e}")
+            return False
+    
+    async def rebuild_row_index(self):
+        """Построение индекса ID анкеты -> (строка, собеседующий) одним чтением колонок J:K"""
+        if not self.google_connected or not self.sheet_service:
+            return False
+        
+        try:
+            # Со строки 2: строка 1 - заголовки
+            result = await self._execute(self.sheet_service.spreadsheets().values().get(
+                spreadsheetId=SPREADSHEET_ID,
+                range=f'{SUBMISSION_ID_COLUMN}2:{SUBMITTER_ID_COLUMN}'
+            ))
+            row_index = {}
+            row_ids = {}
+            for row, cells in enumerate(result.get('values', []), start=2):
+                submission_id = str(cells[0]).strip() if cells else ''
+                if not submission_id:
+                    continue
+                submitter = str(cells[1]).strip() if len(cells) > 1 else ''
+                row_index[submission_id] = (row, int(submitter) if submitter.lstrip('-').isdigit() else None)
+                row_ids[row] = submission_id
+            self.row_index = row_index
+            self._row_ids = row_ids
+            logger.info(f"🗂 Индекс анкет: {len(self.row_index)} записей")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка построения индекса анкет: {e}")
+            return False
+    
+    def new_submission_id(self):
+        """Новый ID анкеты, которого еще нет в индексе"""
+        while True:
+            submission_id = uuid.uuid4().hex[:12]
+            if submission_id not in self.row_index:
+                return submission_id
+    
+    def is_admin(self, user_id):
+        """Пользователь указан в ADMIN_IDS"""
+        return user_id is not None and user_id in self.admin_ids
+    
+    def can_edit(self, user_id, submission_id):
+        """Исправлять анкету может ее автор или администратор"""
+        if self.is_admin(user_id):
+            return True
+        entry = self.row_index.get(submission_id)
+        return entry is not None and entry[1] is not None and entry[1] == user_id
+    
+    async def edit_submission(self, submission_id, field, value, edited_by=None):
+        """Изменение одного поля анкеты одним запросом к таблице.
+        
+        Возвращает номер строки или None, если ID не найден.
+        Права проверяются вызывающим (can_edit).
+        """
+        entry = self.row_index.get(submission_id)
+        if entry is None:
+            return None
+        row = entry[0]
+        
+        column, key = EDIT_FIELDS[field]
+        await self._execute(self.sheet_service.spreadsheets().values().update(
+            spreadsheetId=SPREADSHEET_ID,
+            range=f'{column}{row}',
+            valueInputOption='USER_ENTERED',
+            body={'values': [[value]]}
+        ))
+        logger.info(f"✏️  Анкета {submission_id}: {field} изменено в строке {row} (пользователь {edited_by})")
+        
+        if key in ANALYTICS_COLUMNS and self.analytics.set_value(row, key, value):
+            self.schedule_analytics_save()
+        return row
+    
+    async def update_analytics(self, data):
+        """Добавление сохраненной анкеты в кэш аналитики"""
+        if data.get('sheet_row') is None:
+            # Строка неизвестна: анкету дочитает sync_analytics при следующем запуске
+            return
+        try:
+            # Через строку таблицы, чтобы кодировка совпадала с дочитанными из таблицы строками
+            self.analytics.append(AnalyticsCache.row_to_data(self.build_row(data)), data['sheet_row'])
+            self.schedule_analytics_save()
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления кэша аналитики: {e}")
+    
+    def schedule_analytics_save(self):
+        """Отложенная запись кэша аналитики: не чаще раза в ANALYTICS_SAVE_DELAY секунд"""
+        self._analytics_dirty = True
+        if self._analytics_save_task is None or self._analytics_save_task.done():
+            self._analytics_save_task = asyncio.create_task(self._save_analytics_later())
+    
+    async def _save_analytics_later(self):
+        while self._analytics_dirty:
+            try:
+                await asyncio.wait_for(self._analytics_save_now.wait(), ANALYTICS_SAVE_DELAY)
+            except asyncio.TimeoutError:
+                pass
+            self._analytics_dirty = False
+            try:
+                # Снимок кэша - в цикле событий, запись файла - в потоке
+                await asyncio.to_thread(self.analytics.save, self.analytics.dump())
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи кэша аналитики: {e}")
+    
+    async def flush_analytics(self):
+        """Немедленная запись отложенных изменений кэша аналитики (при остановке)"""
+        task = self._analytics_save_task
+        if task is not None and not task.done():
+            self._analytics_save_now.set()
+            await task
+        self._analytics_save_now.clear()
+    
+    async def drain_pending_writes(self, timeout=None):
+        """Ожидание незавершенных записей с дедлайном.
+        
+        Все, что не успело записаться за timeout секунд, сохраняется в локальный файл.
+        Уже начатый запрос к таблице прервать нельзя, поэтому такие анкеты помечаются
+        sheet_write_in_flight: перед переносом в таблицу проверьте submission_id.
+        """
+        if timeout is None:
+            timeout = self.shutdown_timeout
+        if not self._pending_writes:
+            return
+        
+        logger.info(f"⏳ Жду завершения {len(self._pending_writes)} записей (до {timeout} сек)...")
+        done, pending = await asyncio.wait(list(self._pending_writes), timeout=timeout)
+        logger.info(f"✅ Завершено записей: {len(done)}")
+        
+        # Запрещаем начинать новые записи и отпускаем ожидающие обработчики
+        self._drain_expired.set()
+        for task in pending:
+            data = self._pending_writes.pop(task, None)
+            logger.warning(
+                f"⚠️  Запись анкеты {data.get('submission_id', '') if data else ''} "
+                f"не завершилась до дедлайна, сохраняю локально (возможен дубликат в таблице)"
+            )
+            if data is not None:
+                await self.save_to_local_file(dict(data, sheet_write_in_flight=True))
+    
+    async def record_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запись входящего обновления (если включена запись трафика)"""
+        try:
+            self.recorder.record_update(update.to_dict())
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи обновления: {e}")
+    
+    async def reject_during_shutdown(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Не принимаем новые сообщения, пока бот останавливается"""
+        if not self.shutting_down:
+            return
+        
+        if update.effective_message:
+            await update.effective_message.reply_text(
+                "⏳ Бот перезапускается, повторите через минуту."
+            )
+        raise ApplicationHandlerStop
+    
+    async def graceful_shutdown(self, application):
+        """Остановка: перестаем принимать обновления, дожидаемся записей, выходим из run_polling"""
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+        
+        # Один дедлайн на записи и уведомления
+        deadline = time.monotonic() + self.shutdown_timeout
+        try:
+            # Перестаем забирать обновления: новые останутся у Telegram до следующего запуска
+            updater = getattr(application, 'updater', None)
+            if updater is not None and updater.running:
+                await updater.stop()
+            
+            await self.drain_pending_writes(max(0.0, deadline - time.monotonic()))
+            if self.notifier is not None:
+                await self.notifier.stop(max(0.0, deadline - time.monotonic()))
+            await self.flush_analytics()
+        except Exception as e:
+            logger.error(f"❌ Ошибка при ожидании записей: {e}", exc_info=True)
+        finally:
+            # run_polling остановит приложение и сохранит persistence (незаконченные анкеты)
+            application.stop_running()
+    
+    async def post_init(self, application):
+        """Установка обработчиков сигналов, синхронизация кэша аналитики и запуск уведомлений"""
+        # Сигналы - первыми, чтобы redeploy во время долгого старта тоже был мягким
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(
+                    sig,
+                    lambda s=sig: self._on_signal(s, application)
+                )
+            except NotImplementedError:
+                # Windows: add_signal_handler не поддерживается
+                signal.signal(sig, lambda signum, frame: self._on_signal(signum, application))
+        
+        if not self.admin_ids:
+            logger.warning("⚠️  ADMIN_IDS не задан: /analytics недоступна, /edit - только авторам анкет")
+        
+        await self.sync_analytics()
+        await self.rebuild_row_index()
+        
+        if self.notify_routes:
+            self.notifier = NotificationQueue(application.bot)
+            self.notifier.start()
+            logger.info(f"🔔 Уведомления проверяющим включены: {list(self.notify_routes)}")
+    
+    async def post_shutdown(self, application):
+        """Запись кэша аналитики и закрытие лога записи трафика"""
+        await self.flush_analytics()
+        if self.recorder is not None:
+            self.recorder.close()
+    
+    def _on_signal(self, signum, application):
+        """Обработчик сигналов для graceful shutdown"""
+        logger.info(f"📶 Получен сигнал {signum}, завершаю работу...")
+        application.create_task(self.graceful_shutdown(application))
+    
+    def build_row(self, data):
+        """Строка таблицы (A:Q) из данных анкеты"""
+        # Собираем впечатления из шагов 5-10
+        impressions_parts = []
+        for i in range(1, 7):
+            key = f'impressions_{i}'
+            value = data.get(key)
+            if value and value != 'None' and value != '' and value != 'Затрудняюсь ответить':
+                impressions_parts.append(value)
+        
+        impressions_str = "; ".join(impressions_parts) if impressions_parts else ""
+        
+        # Формируем строку для записи
+        row_data = [
+            data.get('fio', ''),                    # A: ФИО абитуриента
+            data.get('interviewer', ''),            # B: Собеседующий
+            data.get('canonical_obstacles', ''),    # C: Канонические препятствия
+            data.get('spiritual_guide', ''),        # D: Духовник
+            impressions_str,                        # E: Впечатления (шаги 5-10)
+            data.get('problems', ''),               # F: Проблемы в учебе
+            data.get('comments', ''),               # G: Комментарии
+            data.get('verdict', ''),                # H: Вердикт
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # I: Дата
+            data.get('submission_id', ''),          # J: ID анкеты
+            data.get('submitter_id', ''),           # K: Telegram ID собеседующего
+        ]
+        # L:Q: ответы шагов 5-10 по отдельности; пусто - вопрос не задавался
+        row_data.extend(data.get(f'impressions_{i}', '') for i in range(1, 7))
+        
+        # Очищаем данные
+        return ['' if cell is None else str(cell) for cell in row_data]
+    
     async def save_to_sheet(self, data):
         """Сохранение данных в Google Sheets"""
         if not self.google_connected or not self.sheet_service:
@@ -163,97 +1101,42 @@ class InterviewBot:
         try:
             logger.info("💾 Начинаю сохранение данных в Google Sheets...")
             
-            # Собираем впечатления из шагов 5-10
-            impressions_parts = []
-            for i in range(1, 7):
-                key = f'impressions_{i}'
-                value = data.get(key)
-                if value and value != 'None' and value != '' and value != 'Затрудняюсь ответить':
-                    impressions_parts.append(value)
-            
-            impressions_str = "; ".join(impressions_parts) if impressions_parts else ""
-            
-            # Формируем строку для записи
-            row_data = [
-                data.get('fio', ''),                    # A: ФИО абитуриента
-                data.get('interviewer', ''),            # B: Собеседующий
-                data.get('canonical_obstacles', ''),    # C: Канонические препятствия
-                data.get('spiritual_guide', ''),        # D: Духовник
-                impressions_str,                        # E: Впечатления (шаги 5-10)
-                data.get('problems', ''),               # F: Проблемы в учебе
-                data.get('comments', ''),               # G: Комментарии
-                data.get('verdict', ''),                # H: Вердикт
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # I: Дата
-            ]
-            
-            # Очищаем данные
-            row_data = ['' if cell is None else str(cell) for cell in row_data]
+            row_data = self.build_row(data)
             
             logger.info(f"📝 Данные для сохранения:")
             for i, cell in enumerate(row_data):
                 logger.info(f"  {chr(65+i)}: {cell}")
             
-            # Определяем следующую строку
-            try:
-                result = self.sheet_service.spreadsheets().values().get(
-                    spreadsheetId=SPREADSHEET_ID,
-                    range='A:A',
-                    majorDimension='COLUMNS'
-                ).execute()
-                
-                values = result.get('values', [])
-                
-                if values and len(values) > 0:
-                    # Считаем все непустые ячейки в колонке A
-                    column_a = values[0]
-                    # Фильтруем пустые строки
-                    non_empty_cells = [cell for cell in column_a if cell and str(cell).strip()]
-                    next_row = len(non_empty_cells) + 1
-                    logger.info(f"📊 Найдено {len(non_empty_cells)} непустых ячеек в колонке A")
-                else:
-                    next_row = 2  # Начинаем со второй строки (после заголовков)
-                    logger.info("📊 Таблица пуста, начинаем со строки 2")
-                
-                logger.info(f"📝 Буду записывать в строку {next_row}")
-                
-                # Подготовка данных для записи
-                body = {
-                    'values': [row_data]
-                }
-                
-                # Записываем данные
-                update_response = self.sheet_service.spreadsheets().values().update(
-                    spreadsheetId=SPREADSHEET_ID,
-                    range=f'A{next_row}',
-                    valueInputOption='USER_ENTERED',
-                    body=body
-                ).execute()
-                
-                logger.info(f"✅ Данные успешно сохранены в строку {next_row}!")
-                logger.info(f"📊 Обновлено ячеек: {update_response.get('updatedCells', 0)}")
-                logger.info(f"📊 Обновлено строк: {update_response.get('updatedRows', 0)}")
-                logger.info(f"📊 Обновлено колонок: {update_response.get('updatedColumns', 0)}")
-                
-                return True
-                
-            except HttpError as error:
-                logger.error(f"❌ Ошибка при определении строки: {error}")
-                # Пробуем записать в строку 2
-                logger.info("🔄 Пробую записать в строку 2...")
-                body = {
-                    'values': [row_data]
-                }
-                
-                update_response = self.sheet_service.spreadsheets().values().update(
-                    spreadsheetId=SPREADSHEET_ID,
-                    range='A2',
-                    valueInputOption='USER_ENTERED',
-                    body=body
-                ).execute()
-                
-                logger.info(f"✅ Данные успешно сохранены в строку 2!")
+            # Дописываем после последней строки таблицы одним запросом;
+            # номер строки берем из ответа, а не из подсчета колонки A
+            append_response = await self._execute(self.sheet_service.spreadsheets().values().append(
+                spreadsheetId=SPREADSHEET_ID,
+                range='A1',
+                valueInputOption='USER_ENTERED',
+                insertDataOption='OVERWRITE',
+                body={'values': [row_data]}
+            ))
+            updates = append_response.get('updates', {})
+            next_row = self._row_from_range(updates.get('updatedRange', ''))
+            
+            logger.info(f"✅ Данные успешно сохранены в строку {next_row}!")
+            logger.info(f"📊 Обновлено ячеек: {updates.get('updatedCells', 0)}")
+            
+            if next_row is None:
+                # Без номера строки нельзя обновить кэш и индекс; их догонит следующий запуск
+                logger.warning(f"⚠️  Не удалось определить строку записи: {updates.get('updatedRange')}")
                 return True
-                
+            
+            # Строка могла быть очищена вручную: прежний ID в ней больше не действителен
+            stale_id = self._row_ids.pop(next_row, None)
+            if stale_id is not None and self.row_index.get(stale_id, (None,))[0] == next_row:
+                del self.row_index[stale_id]
+            data['sheet_row'] = next_row
+            if data.get('submission_id'):
+                self.row_index[data['submission_id']] = (next_row, data.get('submitter_id') or None)
+                self._row_ids[next_row] = data['submission_id']
+            return True
+            
         except HttpError as error:
             logger.error(f"❌ Ошибка Google Sheets API: {error}")
             if error.resp.status == 403:
@@ -265,6 +1148,13 @@ class InterviewBot:
             await self.save_to_local_file(data)
             return False
     
+    @staticmethod
+    def _row_from_range(updated_range):
+        """'Лист1!A5:Q5' -> 5; None, если номер строки не найден"""
+        cell = updated_range.rsplit('!', 1)[-1].split(':')[0]
+        digits = ''.join(ch for ch in cell if ch.isdigit())
+        return int(digits) if digits else None
+    
     async def save_to_local_file(self, data):
         """Сохранение данных в локальный файл как временное решение"""
         try:
@@ -284,9 +1174,14 @@ class InterviewBot:
             data_with_timestamp['saved_at'] = datetime.now().isoformat()
             file_data.append(data_with_timestamp)
             
-            # Сохраняем
-            with open(filename, 'w', encoding='utf-8') as f:
+            # Сохраняем атомарно: пишем во временный файл и подменяем,
+            # чтобы прерванная запись не испортила backup_data.json
+            tmp_filename = f"{filename}.tmp"
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
                 json.dump(file_data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_filename, filename)
             
             logger.info(f"✅ Данные сохранены в локальный файл {filename}")
             logger.warning("⚠️  Эти данные нужно будет вручную перенести в Google Sheets")
@@ -305,6 +1200,33 @@ class InterviewBot:
             logger.error(f"❌ Ошибка сохранения в локальный файл: {e}")
             return False
     
+    def notify_reviewers(self, data, saved_to_sheet=True):
+        """Постановка в очередь уведомлений по выбранным ответам (не ждет отправки)"""
+        if self.notifier is None:
+            return
+        
+        reasons = {}
+        for field, answers in self.notify_routes.items():
+            answer = data.get(field)
+            for chat_id in answers.get(answer, []):
+                reasons.setdefault(chat_id, []).append(f"{NOTIFY_FIELD_NAMES.get(field, field)}: {answer}")
+        
+        if saved_to_sheet:
+            status = f"ID анкеты: {data.get('submission_id', '')}"
+        else:
+            # ID без строки в таблице бесполезен для /edit
+            status = "⚠️  Сохранено только локально (backup_data.json), в таблице пока нет"
+        
+        for chat_id, chat_reasons in reasons.items():
+            text = (
+                f"🔔 {'; '.join(chat_reasons)}\n"
+                f"{status}\n"
+                f"Абитуриент: {data.get('fio', '')}\n"
+                f"Собеседующий: {data.get('interviewer', '')}\n"
+                f"Комментарии: {data.get('comments', '') or '—'}"
+            )
+            self.notifier.enqueue(chat_id, text)
+    
     def get_main_keyboard(self):
         """Создает основную клавиатуру с кнопкой перезапуска"""
         keyboard = [['🔄 Перезапустить бот']]
@@ -601,16 +1523,21 @@ class InterviewBot:
             return await self.restart_handler(update, context)
         
         context.user_data['verdict'] = update.message.text
+        context.user_data['submission_id'] = self.new_submission_id()
+        context.user_data['submitter_id'] = update.effective_user.id if update.effective_user else ''
         
         # Сохраняем данные
-        success = await self.save_to_sheet(context.user_data)
+        success = await self.save_submission(context.user_data)
+        self.notify_reviewers(context.user_data, saved_to_sheet=success)
         
         if success:
             keyboard = [['Далее'], ['🔄 Перезапустить бот']]
             reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
             
             await update.message.reply_text(
-                "✅ Данные успешно сохранены в Google Sheets!\n\n"
+                "✅ Данные успешно сохранены в Google Sheets!\n"
+                f"ID анкеты: {context.user_data['submission_id']}\n"
+                f"(для исправления: /edit {context.user_data['submission_id']} <поле> <значение>)\n\n"
                 "Спасибо!\n"
                 "Чтобы отправить еще один отзыв, нажмите 'Далее'",
                 reply_markup=reply_markup
@@ -661,9 +1588,90 @@ class InterviewBot:
         context.user_data.clear()
         return ConversationHandler.END
     
-    def create_application(self):
-        """Создание приложения с обработчиками"""
-        application = Application.builder().token(self.token).build()
+    async def analytics_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /analytics: /analytics verdict guide (только администраторы)"""
+        user_id = update.effective_user.id if update.effective_user else None
+        if not self.is_admin(user_id):
+            logger.warning(f"⚠️  /analytics без прав: пользователь {user_id}")
+            await update.message.reply_text("⛔ Команда доступна только администраторам.")
+            return
+        
+        names = context.args or ['verdict']
+        unknown = [name for name in names if name not in ANALYTICS_ALIASES]
+        if unknown or len(names) > 3:
+            await update.message.reply_text(
+                "Использование: /analytics <колонка> [<колонка> ...] (не более 3)\n"
+                f"Колонки: {', '.join(ANALYTICS_ALIASES)}"
+            )
+            return
+        
+        cols = [ANALYTICS_ALIASES[name] for name in names]
+        started = time.perf_counter()
+        counts = self.analytics.group_by(*cols)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        lines = [f"📊 {' × '.join(names)} — строк: {len(self.analytics)}, {elapsed_ms:.1f} мс", ""]
+        for key, count in sorted(counts.items(), key=lambda item: -item[1]):
+            lines.append(f"{count}: {' | '.join(value or '—' for value in key)}")
+        
+        text = "\n".join(lines)
+        if len(text) > 4000:
+            text = text[:4000] + "\n…"
+        await update.message.reply_text(text)
+    
+    async def edit_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /edit: /edit <ID анкеты> <поле> <новое значение>"""
+        args = context.args or []
+        if len(args) < 3 or args[1] not in EDIT_FIELDS:
+            await update.message.reply_text(
+                "Использование: /edit <ID анкеты> <поле> <новое значение>\n"
+                f"Поля: {', '.join(EDIT_FIELDS)}"
+            )
+            return
+        
+        if not self.google_connected or not self.sheet_service:
+            await update.message.reply_text("⚠️  Google Sheets отключен, исправление невозможно.")
+            return
+        
+        submission_id, field, value = args[0], args[1], ' '.join(args[2:])
+        user_id = update.effective_user.id if update.effective_user else None
+        if not self.can_edit(user_id, submission_id):
+            # Тот же ответ, что и для несуществующего ID, чтобы нельзя было подбирать ID
+            logger.warning(f"⚠️  /edit без прав: пользователь {user_id}, анкета {submission_id}")
+            await update.message.reply_text(f"❌ Анкета {submission_id} не найдена.")
+            return
+        
+        try:
+            row = await self.edit_submission(submission_id, field, value, edited_by=user_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка исправления анкеты {submission_id}: {e}", exc_info=True)
+            await update.message.reply_text("❌ Не удалось исправить анкету, попробуйте позже.")
+            return
+        
+        if row is None:
+            await update.message.reply_text(f"❌ Анкета {submission_id} не найдена.")
+        else:
+            await update.message.reply_text(f"✅ Анкета {submission_id}: поле '{field}' исправлено (строка {row}).")
+    
+    def create_application(self, request=None, persistence_file=PERSISTENCE_FILE):
+        """Создание приложения с обработчиками
+        
+        request - свой HTTP-клиент Bot API (например, фейковый в replay.py).
+        persistence_file - файл для незаконченных анкет; None - без сохранения.
+        """
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+        )
+        if persistence_file:
+            builder = builder.persistence(PicklePersistence(filepath=persistence_file))
+        if request is None and self.recorder is not None:
+            request = RecordingRequest(self.recorder)
+        if request is not None:
+            builder = builder.request(request)
+        application = builder.build()
         
         restart_filter = filters.Regex('^🔄 Перезапустить бот$')
         
@@ -697,23 +1705,22 @@ class InterviewBot:
                 CommandHandler('cancel', self.cancel_handler)
             ],
             allow_reentry=True,
+            name='interview',
+            persistent=bool(persistence_file),
         )
         
+        if self.recorder is not None:
+            application.add_handler(TypeHandler(Update, self.record_update), group=-2)
+        application.add_handler(TypeHandler(Update, self.reject_during_shutdown), group=-1)
         application.add_handler(CommandHandler('start', self.start_handler))
+        application.add_handler(CommandHandler('analytics', self.analytics_handler))
+        application.add_handler(CommandHandler('edit', self.edit_handler))
         application.add_handler(conv_handler)
         
         return application
 
-def signal_handler(signum, frame):
-    """Обработчик сигналов для graceful shutdown"""
-    print(f"\n📶 Получен сигнал {signum}, завершаю работу...")
-    sys.exit(0)
-
 def main():
     """Основная функция запуска бота"""
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
     BOT_TOKEN = os.environ.get('BOT_TOKEN')
     
     if not BOT_TOKEN:
@@ -732,6 +1739,8 @@ def main():
     print(f"BOT_TOKEN установлен: {'Да' if BOT_TOKEN else 'Нет'}")
     print(f"GOOGLE_CREDENTIALS установлена: {'Да' if os.environ.get('GOOGLE_CREDENTIALS') else 'Нет'}")
     print(f"Spreadsheet ID: {SPREADSHEET_ID}")
+    print(f"Файл незаконченных анкет (PERSISTENCE_FILE): {PERSISTENCE_FILE}")
+    print(f"Администраторов (ADMIN_IDS): {len(load_admin_ids())}")
     print(f"Service Account Email: telegram-bot-service@telegram-bot-sheets-485811.iam.gserviceaccount.com")
     print("="*50)
     
@@ -757,9 +1766,13 @@ def main():
     print("🔄 Кнопка 'Перезапустить бот' доступна всегда")
     print("="*50)
     
+    # Сигналы обрабатываются в bot.post_init (graceful shutdown),
+    # поэтому стандартные обработчики run_polling отключены
     application.run_polling(
         allowed_updates=Update.ALL_TYPES,
-        drop_pending_updates=True
+        # Обновления, пришедшие во время перезапуска, обрабатываются после старта
+        drop_pending_updates=False,
+        stop_signals=None
     )
 
 if __name__ == '__main__':
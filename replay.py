@@ -0,0 +1,273 @@
+"""Воспроизведение записанного трафика (RECORD_FILE) на фейковых бэкендах.
+
+Пример:
+    python replay.py traffic.bin --speed 10
+
+Обновления подаются в InterviewBot.create_application() с исходными интервалами,
+деленными на --speed (0 - без пауз). Фейковые Bot API и Google Sheets
+воспроизводят записанные задержки в том же порядке, в котором они были записаны.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+from telegram import Update
+from telegram.ext import TypeHandler
+from telegram.request import BaseRequest
+
+from main import AnalyticsCache, InterviewBot, TrafficRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class RecordedLatencies:
+    """Записанные задержки по имени операции, выдаются по кругу в исходном порядке"""
+
+    def __init__(self):
+        self._durations = defaultdict(list)
+        self._positions = defaultdict(int)
+
+    def add(self, name, duration):
+        self._durations[name].append(duration)
+
+    def next(self, name):
+        durations = self._durations.get(name)
+        if not durations:
+            return 0.0
+        position = self._positions[name]
+        self._positions[name] = position + 1
+        return durations[position % len(durations)]
+
+
+class FakeSheetsRequest:
+    """Запрос фейкового Google Sheets: execute() ждет записанную задержку"""
+
+    def __init__(self, method_id, latencies, handler):
+        self.methodId = method_id
+        self._latencies = latencies
+        self._handler = handler
+
+    def execute(self):
+        # Вызывается из потока (InterviewBot._execute), поэтому time.sleep
+        time.sleep(self._latencies.next(self.methodId))
+        return self._handler()
+
+
+class FakeSheetsService:
+    """Минимальная замена сервиса googleapiclient для InterviewBot"""
+
+    def __init__(self, latencies):
+        self._latencies = latencies
+        self.rows = [["ФИО абитуриента"]]
+
+    @staticmethod
+    def _parse_cell(cell):
+        """'H12' -> (7, 12)"""
+        letters = ''.join(ch for ch in cell if ch.isalpha())
+        digits = ''.join(ch for ch in cell if ch.isdigit())
+        return ord(letters.upper()) - ord('A') if letters else 0, int(digits) if digits else 1
+
+    def _column(self, index):
+        return [row[index] if len(row) > index else '' for row in self.rows]
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range=None, majorDimension=None, **kwargs):
+        if range is None:
+            return FakeSheetsRequest(
+                'sheets.spreadsheets.get', self._latencies,
+                lambda: {'properties': {'title': 'replay'}}
+            )
+        start, _, end = range.partition(':')
+        if start and start.isalpha() and start == end:
+            # Целая колонка, например 'A:A' или 'J:J'
+            index = ord(start.upper()) - ord('A')
+            return FakeSheetsRequest(
+                'sheets.spreadsheets.values.get', self._latencies,
+                lambda: {'values': [self._column(index)]}
+            )
+        return FakeSheetsRequest(
+            'sheets.spreadsheets.values.get', self._latencies,
+            lambda: {'values': self._range(start, end or start)}
+        )
+
+    def _range(self, start, end):
+        """Значения диапазона вида 'A2:I' или 'J2:K5' построчно, как отдает API"""
+        first_column, first_row = self._parse_cell(start)
+        last_column = ord(''.join(ch for ch in end if ch.isalpha()).upper()) - ord('A')
+        digits = ''.join(ch for ch in end if ch.isdigit())
+        last_row = int(digits) if digits else len(self.rows)
+
+        values = []
+        for row in self.rows[first_row - 1:last_row]:
+            cells = row[first_column:last_column + 1]
+            while cells and cells[-1] == '':
+                cells = cells[:-1]
+            values.append(list(cells))
+        # API не возвращает пустые строки в конце диапазона
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def update(self, spreadsheetId, range, valueInputOption, body, **kwargs):
+        def handler():
+            column, row_number = self._parse_cell(range.split(':')[0])
+            values = body['values'][0]
+            while len(self.rows) < row_number:
+                self.rows.append([])
+            row = self.rows[row_number - 1]
+            if len(row) < column + len(values):
+                row.extend([''] * (column + len(values) - len(row)))
+            row[column:column + len(values)] = values
+            return {'updatedCells': len(values), 'updatedRows': 1, 'updatedColumns': len(values)}
+        return FakeSheetsRequest('sheets.spreadsheets.values.update', self._latencies, handler)
+
+    def append(self, spreadsheetId, range, valueInputOption, body, insertDataOption=None, **kwargs):
+        def handler():
+            # Как API: запись в строку после последней непустой строки таблицы
+            values = body['values'][0]
+            last = len(self.rows)
+            while last > 0 and not any(str(cell).strip() for cell in self.rows[last - 1]):
+                last -= 1
+            del self.rows[last:]
+            self.rows.append(list(values))
+            row_number = len(self.rows)
+            last_column = chr(ord('A') + len(values) - 1)
+            return {'updates': {
+                'updatedRange': f"Sheet1!A{row_number}:{last_column}{row_number}",
+                'updatedRows': 1,
+                'updatedCells': len(values),
+            }}
+        return FakeSheetsRequest('sheets.spreadsheets.values.append', self._latencies, handler)
+
+
+class FakeBotRequest(BaseRequest):
+    """Фейковый Bot API: отвечает успехом после записанной задержки"""
+
+    def __init__(self, latencies):
+        self._latencies = latencies
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        await asyncio.sleep(self._latencies.next(endpoint))
+
+        parameters = request_data.parameters if request_data is not None else {}
+        if endpoint == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Replay', 'username': 'replay_bot'}
+        elif endpoint == 'sendMessage':
+            self._message_id += 1
+            result = {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': parameters.get('chat_id', 0), 'type': 'private'},
+                'text': parameters.get('text', ''),
+            }
+        else:
+            result = True
+
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def replay(filename, speed):
+    """Воспроизведение лога, возвращает задержки обработки обновлений (сек)"""
+    sheets_latencies = RecordedLatencies()
+    bot_latencies = RecordedLatencies()
+    updates = []
+
+    for kind, offset, payload in TrafficRecorder.read(filename):
+        if kind == TrafficRecorder.UPDATE:
+            updates.append((offset, payload))
+        elif kind == TrafficRecorder.SHEETS_CALL:
+            sheets_latencies.add(payload['method'], payload['duration'])
+        elif kind == TrafficRecorder.BOT_API_CALL:
+            bot_latencies.add(payload['endpoint'], payload['duration'])
+
+    logger.info(f"▶️  Воспроизвожу {len(updates)} обновлений из {filename} (скорость x{speed or '∞'})")
+
+    bot = InterviewBot('0:replay', sheet_service=FakeSheetsService(sheets_latencies))
+    # Кэш аналитики во временном файле, чтобы не трогать рабочий
+    cache_dir = tempfile.mkdtemp(prefix='replay_')
+    bot.analytics = AnalyticsCache(os.path.join(cache_dir, 'analytics_cache.bin'))
+
+    application = bot.create_application(
+        request=FakeBotRequest(bot_latencies),
+        persistence_file=os.path.join(cache_dir, 'persistence.pickle')
+    )
+
+    enqueued = {}
+    latencies = []
+
+    async def mark_done(update: Update, context):
+        started = enqueued.pop(update.update_id, None)
+        if started is not None:
+            latencies.append(time.monotonic() - started)
+
+    # Группа после основных обработчиков: срабатывает, когда обновление обработано
+    application.add_handler(TypeHandler(Update, mark_done), group=99)
+
+    await application.initialize()
+    await application.start()
+
+    first_offset = updates[0][0] if updates else 0.0
+    started = time.monotonic()
+    for offset, payload in updates:
+        if speed:
+            delay = (offset - first_offset) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.de_json(payload, application.bot)
+        enqueued[update.update_id] = time.monotonic()
+        await application.update_queue.put(update)
+
+    # stop() дожидается обработки всех обновлений в очереди
+    await application.stop()
+    await application.shutdown()
+    await bot.flush_analytics()
+
+    logger.info(f"⏱ Общее время: {time.monotonic() - started:.2f} сек")
+    logger.info(
+        f"⏱ Обработка обновления: p50={percentile(latencies, 0.5) * 1000:.1f} мс, "
+        f"p95={percentile(latencies, 0.95) * 1000:.1f} мс, "
+        f"max={max(latencies, default=0.0) * 1000:.1f} мс"
+    )
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика бота")
+    parser.add_argument('log', help="файл, записанный с RECORD_FILE")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="ускорение относительно исходного темпа (0 - без пауз)")
+    args = parser.parse_args()
+
+    asyncio.run(replay(args.log, args.speed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+from types import SimpleNamespace
+
+from main import ANALYTICS_COLUMNS, AnalyticsCache, InterviewBot
+from replay import FakeSheetsService, RecordedLatencies
+
+
+def decoded(cache):
+    return {
+        col: [cache.categories[col][code] for code in cache.columns[col]]
+        for col in ANALYTICS_COLUMNS
+    }
+
+
+def test_live_append_matches_resync_from_sheet(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    sheets = FakeSheetsService(RecordedLatencies())
+    bot = InterviewBot('0:test', sheet_service=sheets)
+    bot.analytics = AnalyticsCache(str(tmp_path / 'live.bin'))
+
+    submission = {
+        'fio': 'Иванов Иван',
+        'interviewer': 'иер. Иван Воробьев',
+        'canonical_obstacles': 'Нет канонических препятствий, можем принять в ПСТБИ',
+        'spiritual_guide': 'Нет духовника',
+        'impressions_1': 'Затрудняюсь ответить',
+        'impressions_2': 'Давно в церкви',
+        'impressions_3': 'Затрудняюсь ответить',
+        'impressions_4': 'Помогает в храме',
+        'impressions_5': 'Не женат',
+        'impressions_6': 'Вполне зрелый',
+        'verdict': 'Да',
+        'submission_id': 'abcd1234',
+    }
+    assert asyncio.run(bot.save_submission(submission))
+
+    resynced = AnalyticsCache(str(tmp_path / 'resync.bin'))
+    resynced.append_rows(sheets.rows[1:])
+
+    assert decoded(bot.analytics) == decoded(resynced)
+    assert bot.analytics.group_by('impressions_1') == {('Затрудняюсь ответить',): 1}
+    assert bot.analytics.group_by('impressions_3') == {('Затрудняюсь ответить',): 1}
+
+
+def test_legacy_rows_split_impressions_column():
+    # Строка, сохраненная до появления колонок L:Q: ответы только в колонке E
+    row = ['Иванов Иван', 'иер. Иван Воробьев', '', '', 'Замкнутый; Не женат', '', '', 'Да']
+    data = AnalyticsCache.row_to_data(row)
+    assert data['impressions_1'] == 'Замкнутый'
+    assert data['impressions_5'] == 'Не женат'
+    assert 'impressions_2' not in data
+
+
+def test_rows_added_out_of_band_are_resynced(tmp_path):
+    sheets = FakeSheetsService(RecordedLatencies())
+    bot = InterviewBot('0:test', sheet_service=sheets)
+    bot.google_connected = True
+    bot.analytics = AnalyticsCache(str(tmp_path / 'cache.bin'))
+
+    # Строка 2 вставлена вручную (например, из backup_data.json), бот пишет в строку 3
+    sheets.rows.append(['Петров Петр', '', '', '', '', '', '', 'Нет'])
+    sheets.rows.append(['Иванов Иван', '', '', '', '', '', '', 'Да'])
+    bot.analytics.append({'verdict': 'Да'}, 3)
+    assert bot.analytics.synced_rows == 0
+
+    assert asyncio.run(bot.sync_analytics())
+    assert sorted(bot.analytics.sheet_rows) == [2, 3]
+    assert bot.analytics.synced_rows == 2
+    assert bot.analytics.group_by('verdict') == {('Да',): 1, ('Нет',): 1}
+
+
+def test_many_distinct_values_keep_columns_aligned(tmp_path):
+    cache = AnalyticsCache(str(tmp_path / 'cache.bin'))
+    rows = 70000  # больше, чем помещается в 16-битный код
+    for sheet_row in range(2, rows + 2):
+        cache.append({'interviewer': f'Собеседующий {sheet_row}', 'verdict': 'Да'}, sheet_row)
+
+    assert len(cache) == rows
+    assert all(len(column) == rows for column in cache.columns.values())
+
+    loaded = AnalyticsCache(str(tmp_path / 'cache.bin'))
+    cache.save(cache.dump())
+    loaded.load()
+    assert decoded(loaded) == decoded(cache)
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def test_analytics_requires_admin(tmp_path):
+    bot = InterviewBot('0:test', sheet_service=FakeSheetsService(RecordedLatencies()))
+    bot.analytics = AnalyticsCache(str(tmp_path / 'cache.bin'))
+    bot.analytics.append({'verdict': 'Да'}, 2)
+    bot.admin_ids = {1}
+
+    def request(user_id):
+        message = FakeMessage()
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id), message=message)
+        asyncio.run(bot.analytics_handler(update, SimpleNamespace(args=['verdict'])))
+        return message.replies[0]
+
+    assert request(2).startswith('⛔')
+    assert request(1).startswith('📊')
+
+    bot.admin_ids = set()
+    assert request(1).startswith('⛔')
@@ -0,0 +1,108 @@
+import asyncio
+import uuid
+
+from main import AnalyticsCache, InterviewBot
+from replay import FakeSheetsService, RecordedLatencies
+
+
+def sheet_row(fio, verdict, submission_id, submitter_id):
+    return [fio, 'иер. Иван Воробьев', '', '', '', '', '', verdict, '', submission_id, str(submitter_id)]
+
+
+def make_bot(tmp_path, monkeypatch, rows):
+    monkeypatch.chdir(tmp_path)
+    sheets = FakeSheetsService(RecordedLatencies())
+    sheets.rows.extend(rows)
+    bot = InterviewBot('0:test', sheet_service=sheets)
+    bot.analytics = AnalyticsCache(str(tmp_path / 'analytics_cache.bin'))
+    bot.admin_ids = {999}
+    asyncio.run(bot.sync_analytics())
+    asyncio.run(bot.rebuild_row_index())
+    return bot, sheets
+
+
+def verdict_of(bot, fio_row):
+    position = list(bot.analytics.sheet_rows).index(fio_row)
+    return bot.analytics.categories['verdict'][bot.analytics.columns['verdict'][position]]
+
+
+def test_only_submitter_or_admin_can_edit(tmp_path, monkeypatch):
+    bot, sheets = make_bot(tmp_path, monkeypatch, [sheet_row('Иванов', 'Да', 'aaaa0001', 111)])
+
+    assert bot.can_edit(111, 'aaaa0001')
+    assert bot.can_edit(999, 'aaaa0001')
+    assert not bot.can_edit(222, 'aaaa0001')
+    assert not bot.can_edit(None, 'aaaa0001')
+    assert not bot.can_edit(222, 'missing')
+
+
+def test_edit_updates_the_right_cache_row_despite_sheet_gaps(tmp_path, monkeypatch):
+    rows = [
+        sheet_row('Иванов', 'Да', 'aaaa0001', 111),
+        [],  # пустая строка в таблице
+        sheet_row('Петров', 'Да', 'aaaa0002', 111),
+        sheet_row('Сидоров', 'Да', 'aaaa0003', 111),
+    ]
+    bot, sheets = make_bot(tmp_path, monkeypatch, rows)
+    assert bot.row_index['aaaa0003'] == (5, 111)
+    assert bot.analytics.synced_rows == 4
+
+    row = asyncio.run(bot.edit_submission('aaaa0003', 'verdict', 'Нет', edited_by=111))
+
+    assert row == 5
+    assert sheets.rows[4][7] == 'Нет'
+    assert verdict_of(bot, 5) == 'Нет'
+    assert verdict_of(bot, 4) == 'Да'
+    assert verdict_of(bot, 2) == 'Да'
+
+
+def test_append_into_cleared_row_drops_stale_id(tmp_path, monkeypatch):
+    rows = [
+        sheet_row('Иванов', 'Да', 'a2', 111),
+        sheet_row('Петров', 'Да', 'a3', 111),
+    ]
+    bot, sheets = make_bot(tmp_path, monkeypatch, rows)
+
+    # Строку 3 очистили в таблице вручную, индекс об этом не знает
+    sheets.rows[2] = [''] * len(sheets.rows[2])
+    submission = {'fio': 'Сидоров', 'verdict': 'Нет', 'submission_id': 'new1', 'submitter_id': 222}
+    assert asyncio.run(bot.save_submission(submission))
+
+    assert sheets.rows[2][9] == 'new1'
+    assert bot.row_index['new1'] == (3, 222)
+    assert 'a3' not in bot.row_index
+    assert asyncio.run(bot.edit_submission('a3', 'verdict', 'Да', edited_by=999)) is None
+    assert len(bot.analytics) == 2
+    assert verdict_of(bot, 3) == 'Нет'
+
+
+def test_new_submission_id_avoids_existing_ids(tmp_path, monkeypatch):
+    bot, sheets = make_bot(tmp_path, monkeypatch, [sheet_row('Иванов', 'Да', 'aaaa0001', 111)])
+    taken = uuid.UUID('0' * 32).hex[:12]
+    bot.row_index[taken] = (3, 111)
+    ids = iter([uuid.UUID('0' * 32), uuid.UUID('1' * 32)])
+    monkeypatch.setattr(uuid, 'uuid4', lambda: next(ids))
+
+    assert bot.new_submission_id() == '1' * 12
+
+
+def test_analytics_edits_are_saved_once_on_flush(tmp_path, monkeypatch):
+    rows = [sheet_row(f'Абитуриент {i}', 'Да', f'id{i}', 111) for i in range(5)]
+    bot, sheets = make_bot(tmp_path, monkeypatch, rows)
+    saves = []
+    original_save = bot.analytics.save
+    monkeypatch.setattr(bot.analytics, 'save', lambda payload=None: saves.append(original_save(payload)))
+
+    async def scenario():
+        for i in range(5):
+            await bot.edit_submission(f'id{i}', 'verdict', 'Нет')
+        # Правки не пишут кэш на диск сами, запись одна - при сбросе
+        assert saves == []
+        await bot.flush_analytics()
+
+    asyncio.run(scenario())
+
+    assert len(saves) == 1
+    loaded = AnalyticsCache(bot.analytics.filename)
+    assert loaded.load()
+    assert loaded.group_by('verdict') == {('Нет',): 5}
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+from telegram import Bot
+from telegram.request import BaseRequest
+
+from main import InterviewBot, NOTIFY_GROUP_INTERVAL, NOTIFY_PRIVATE_INTERVAL, NotificationQueue
+from replay import FakeSheetsService, RecordedLatencies
+
+
+class RateLimitedBotAPI(BaseRequest):
+    """Фейковый Bot API с лимитами Telegram: при превышении отвечает 429 + retry_after.
+
+    Для чатов из flood_chats первая попытка всегда получает 429 (flood control).
+    """
+
+    def __init__(self, global_rate, flood_chats=()):
+        self.global_rate = global_rate
+        self.flood_chats = set(flood_chats)
+        self.accepted = []  # (время, chat_id, текст)
+        self.rejected = []  # (время, chat_id)
+        self._last_by_chat = {}
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _too_many_requests(self, now, chat_id, retry_after):
+        self.rejected.append((now, chat_id))
+        return 429, json.dumps({
+            'ok': False,
+            'error_code': 429,
+            'description': f'Too Many Requests: retry after {retry_after}',
+            'parameters': {'retry_after': retry_after},
+        }).encode('utf-8')
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        if endpoint == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+            return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+        parameters = request_data.parameters
+        chat_id = int(parameters['chat_id'])
+        now = time.monotonic()
+
+        if chat_id in self.flood_chats:
+            self.flood_chats.discard(chat_id)
+            return self._too_many_requests(now, chat_id, 1)
+
+        interval = NOTIFY_GROUP_INTERVAL if chat_id < 0 else NOTIFY_PRIVATE_INTERVAL
+        if now - self._last_by_chat.get(chat_id, float('-inf')) < interval:
+            return self._too_many_requests(now, chat_id, 1)
+        if sum(1 for sent, _, _ in self.accepted if now - sent < 1.0) >= self.global_rate:
+            return self._too_many_requests(now, chat_id, 1)
+
+        self._last_by_chat[chat_id] = now
+        self.accepted.append((now, chat_id, parameters['text']))
+        result = {
+            'message_id': len(self.accepted),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+            'text': parameters['text'],
+        }
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+def test_queue_respects_limits_coalesces_and_survives_retry_after():
+    api = RateLimitedBotAPI(global_rate=10, flood_chats={2})
+    expected = defaultdict(list)
+
+    async def scenario():
+        bot = Bot('123:TEST', request=api, get_updates_request=api)
+        await bot.initialize()
+        queue = NotificationQueue(bot, global_rate=10)
+        queue.start()
+
+        def enqueue(chat_id, text):
+            expected[chat_id].append(text)
+            queue.enqueue(chat_id, text)
+
+        # Много чатов по одному сообщению - упираемся в общий лимит
+        for chat_id in range(10, 30):
+            enqueue(chat_id, f'single {chat_id}')
+        # Всплеск в один чат, пока он ждет лимита, - должен уйти сводкой
+        enqueue(1, 'first 1')
+        await asyncio.sleep(0.1)
+        for i in range(5):
+            enqueue(1, f'burst {i}')
+        # Чат под flood control: первая попытка получает 429
+        for i in range(3):
+            enqueue(2, f'flood {i}')
+        # Группа
+        enqueue(-100, 'group 0')
+        await asyncio.sleep(0.1)
+        enqueue(-100, 'group 1')
+
+        await queue.stop(15)
+        assert len(queue) == 0
+
+    asyncio.run(scenario())
+
+    delivered = defaultdict(list)
+    times = defaultdict(list)
+    for sent, chat_id, text in api.accepted:
+        delivered[chat_id].append(text)
+        times[chat_id].append(sent)
+
+    # Ничего не потеряно, в том числе после RetryAfter
+    for chat_id, texts in expected.items():
+        joined = '\n'.join(delivered[chat_id])
+        for text in texts:
+            assert joined.count(text) == 1, (chat_id, text)
+
+    # 429 только от flood control, лимиты сама очередь не нарушала
+    assert [chat_id for _, chat_id in api.rejected] == [2]
+
+    # Интервалы в чате
+    for chat_id, sent_times in times.items():
+        interval = NOTIFY_GROUP_INTERVAL if chat_id < 0 else NOTIFY_PRIVATE_INTERVAL
+        for previous, current in zip(sent_times, sent_times[1:]):
+            assert current - previous >= interval - 0.05
+
+    # Общий лимит
+    all_times = sorted(sent for sent, _, _ in api.accepted)
+    for i, sent in enumerate(all_times):
+        assert sum(1 for other in all_times[i:] if other - sent < 1.0) <= 10
+
+    # Всплеск ушел сводкой: 6 уведомлений меньше чем в 6 сообщениях
+    assert len(delivered[1]) < len(expected[1])
+    assert any(text.startswith('📬 Сводка') for text in delivered[1])
+    # После 429 три уведомления flood-чата ушли одной сводкой
+    assert len(delivered[2]) == 1
+
+
+def test_submission_saved_during_drain_is_still_notified(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    api = RateLimitedBotAPI(global_rate=10)
+
+    async def scenario():
+        bot = Bot('123:TEST', request=api, get_updates_request=api)
+        await bot.initialize()
+        interview_bot = InterviewBot('0:test', sheet_service=FakeSheetsService(RecordedLatencies()))
+        interview_bot.notify_routes = {'verdict': {'Нет': [5]}}
+        interview_bot.notifier = NotificationQueue(bot, global_rate=10)
+        interview_bot.notifier.start()
+
+        # Остановка началась, очередь дописывает остатки; анкета дописалась в таблицу после этого
+        interview_bot.shutting_down = True
+        interview_bot.notifier.enqueue(5, 'before shutdown')
+        stopping = asyncio.create_task(interview_bot.notifier.stop(15))
+        await asyncio.sleep(0)
+        interview_bot.notify_reviewers({'verdict': 'Нет', 'fio': 'Петров', 'submission_id': 'abc'})
+        await stopping
+
+        # После остановки очереди уведомление не ставится и не падает
+        interview_bot.notify_reviewers({'verdict': 'Нет', 'submission_id': 'late'})
+        assert len(interview_bot.notifier) == 0
+
+    asyncio.run(scenario())
+
+    texts = '\n'.join(text for _, chat_id, text in api.accepted if chat_id == 5)
+    assert 'before shutdown' in texts
+    assert 'ID анкеты: abc' in texts
+    assert 'late' not in texts
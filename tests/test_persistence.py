@@ -0,0 +1,58 @@
+import asyncio
+
+from telegram import Update
+
+from main import FIO, INTERVIEWER, InterviewBot
+from replay import FakeBotRequest, FakeSheetsService, RecordedLatencies
+
+
+def make_update(update_id, text):
+    message = {
+        'message_id': update_id,
+        'date': 0,
+        'text': text,
+        'from': {'id': 42, 'first_name': 'Иван', 'is_bot': False},
+        'chat': {'id': 42, 'type': 'private'},
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'update_id': update_id, 'message': message}
+
+
+async def run_updates(persistence_file, texts, first_update_id):
+    bot = InterviewBot('0:test', sheet_service=FakeSheetsService(RecordedLatencies()))
+    application = bot.create_application(
+        request=FakeBotRequest(RecordedLatencies()),
+        persistence_file=persistence_file
+    )
+    await application.initialize()
+    for update_id, text in enumerate(texts, start=first_update_id):
+        await application.process_update(Update.de_json(make_update(update_id, text), application.bot))
+    # Как при остановке run_polling: данные сбрасываются в persistence
+    await application.update_persistence()
+    await application.shutdown()
+    return application
+
+
+def test_unfinished_questionnaire_survives_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    persistence_file = str(tmp_path / 'bot_persistence.pickle')
+
+    asyncio.run(run_updates(persistence_file, ['🔄 Перезапустить бот', 'Иванов Иван'], 1))
+
+    async def restarted():
+        bot = InterviewBot('0:test', sheet_service=FakeSheetsService(RecordedLatencies()))
+        application = bot.create_application(
+            request=FakeBotRequest(RecordedLatencies()),
+            persistence_file=persistence_file
+        )
+        await application.initialize()
+        user_data = dict(application.user_data[42])
+        conversations = await application.persistence.get_conversations('interview')
+        await application.shutdown()
+        return user_data, conversations
+
+    user_data, conversations = asyncio.run(restarted())
+    assert user_data['fio'] == 'Иванов Иван'
+    assert conversations[(42, 42)] == INTERVIEWER
+    assert INTERVIEWER != FIO
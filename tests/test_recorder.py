@@ -0,0 +1,82 @@
+import pytest
+
+from main import TrafficRecorder
+
+
+def make_update(update_id, text):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'text': text,
+            'from': {'id': 42, 'first_name': 'Иван', 'is_bot': False},
+            'chat': {'id': 42, 'type': 'private'},
+        },
+    }
+
+
+def test_recorder_masks_free_text_and_command_arguments(tmp_path):
+    filename = tmp_path / 'traffic.bin'
+    recorder = TrafficRecorder(str(filename))
+    recorder.remember_keyboard({'keyboard': [['Да', {'text': 'Далее'}]]})
+    recorder.record_update(make_update(1, 'Иванов Иван'))
+    recorder.record_update(make_update(2, 'Да'))
+    recorder.record_update(make_update(3, '/edit abcd1234 fio Иванов Иван'))
+    recorder.record_update(make_update(4, '/start'))
+    recorder.close()
+
+    payloads = [payload for kind, offset, payload in TrafficRecorder.read(str(filename))]
+    texts = [payload['message']['text'] for payload in payloads]
+    assert texts[0] == 'x' * len('Иванов Иван')
+    assert texts[1] == 'Да'
+    assert texts[2] == '/edit ' + 'x' * len('abcd1234 fio Иванов Иван')
+    assert texts[3] == '/start'
+
+    raw = filename.read_bytes()
+    assert 'Иван'.encode('utf-8') not in raw
+    for payload in payloads:
+        assert payload['message']['from']['id'] != 42
+        assert payload['message']['chat']['id'] != 42
+    # Один и тот же пользователь хешируется одинаково в пределах записи
+    assert len({payload['message']['from']['id'] for payload in payloads}) == 1
+
+
+def test_recorder_keeps_only_allowed_fields(tmp_path):
+    filename = tmp_path / 'traffic.bin'
+    recorder = TrafficRecorder(str(filename))
+    update = make_update(1, '/start')
+    update['message'].update({
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6, 'user': {'id': 42}}],
+        'caption': 'Паспорт Иванова',
+        'contact': {'phone_number': '+79991234567', 'first_name': 'Иван', 'user_id': 42},
+        'forward_from': {'id': 777, 'first_name': 'Петр', 'is_bot': False},
+        'forward_from_chat': {'id': -100777, 'type': 'channel', 'title': 'Приход'},
+    })
+    update['callback_query'] = {'id': '1', 'from': {'id': 42, 'first_name': 'Иван'}}
+    recorder.record_update(update)
+    recorder.close()
+
+    [(kind, offset, payload)] = list(TrafficRecorder.read(str(filename)))
+    message = payload['message']
+    assert set(payload) == {'update_id', 'message'}
+    assert set(message) == {'message_id', 'date', 'from', 'chat', 'text', 'entities'}
+    assert message['entities'] == [{'type': 'bot_command', 'offset': 0, 'length': 6}]
+    assert message['from']['first_name'] == ''
+
+    raw = filename.read_bytes()
+    for leaked in ('Паспорт', '+79991234567', 'Петр', 'Приход'):
+        assert leaked.encode('utf-8') not in raw
+
+
+def test_recorder_does_not_overwrite_existing_file(tmp_path):
+    filename = tmp_path / 'traffic.bin'
+    filename.write_bytes(b'incident')
+
+    with pytest.raises(FileExistsError):
+        TrafficRecorder(str(filename))
+    assert filename.read_bytes() == b'incident'
+
+    unique = TrafficRecorder.unique_filename(str(filename))
+    assert unique != str(filename)
+    assert unique.endswith('.bin')
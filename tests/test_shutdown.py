@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import signal
+
+from main import InterviewBot, SUBMISSION_ID_COLUMN
+from replay import FakeSheetsService, RecordedLatencies
+
+
+class FakeUpdater:
+    def __init__(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+
+
+class FakeApplication:
+    """Минимум Application, нужный post_init и graceful_shutdown"""
+
+    def __init__(self):
+        self.stopped = asyncio.Event()
+        self.tasks = []
+        self.updater = FakeUpdater()
+
+    def create_task(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.append(task)
+        return task
+
+    def stop_running(self):
+        self.stopped.set()
+
+
+def make_submissions(count):
+    return [
+        {
+            'fio': f'Абитуриент {i}',
+            'interviewer': 'иер. Иван Воробьев',
+            'verdict': 'Да',
+            'submission_id': f'id{i:04d}',
+        }
+        for i in range(count)
+    ]
+
+
+def test_sigterm_mid_save_loses_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    latencies = RecordedLatencies()
+    latencies.add('sheets.spreadsheets.values.append', 0.2)
+    sheets = FakeSheetsService(latencies)
+
+    bot = InterviewBot('0:test', sheet_service=sheets)
+    bot.shutdown_timeout = 0.5
+    submissions = make_submissions(10)
+
+    async def scenario():
+        application = FakeApplication()
+        await bot.post_init(application)
+        pending_at_updater_stop = []
+        original_stop = application.updater.stop
+
+        async def stop_updater():
+            # Обновления перестают забираться до ожидания записей
+            pending_at_updater_stop.append(len(bot._pending_writes))
+            await original_stop()
+
+        application.updater.stop = stop_updater
+
+        saves = [asyncio.ensure_future(bot.save_submission(data)) for data in submissions]
+        await asyncio.sleep(0.05)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+        await asyncio.wait_for(application.stopped.wait(), 5)
+        assert not application.updater.running
+        assert pending_at_updater_stop and pending_at_updater_stop[0] > 0
+        return await asyncio.wait_for(asyncio.gather(*saves), 5)
+
+    results = asyncio.run(scenario())
+
+    # Часть записей успела в таблицу, остальные ушли в backup
+    assert any(results)
+    assert not all(results)
+
+    id_index = ord(SUBMISSION_ID_COLUMN) - ord('A')
+    sheet_rows = {row[id_index]: row for row in sheets.rows[1:] if len(row) > id_index}
+    # Строки не перезаписывают друг друга и не перепутаны
+    assert len(sheet_rows) == len(sheets.rows) - 1
+    for submission_id, row in sheet_rows.items():
+        assert row[0] == f'Абитуриент {int(submission_id[2:])}'
+
+    with open('backup_data.json', encoding='utf-8') as f:
+        backup = json.load(f)
+    backup_ids = {entry['submission_id'] for entry in backup}
+    assert all(entry['sheet_write_in_flight'] for entry in backup)
+
+    for data, success in zip(submissions, results):
+        assert data['submission_id'] in sheet_rows or data['submission_id'] in backup_ids
+        if not success:
+            assert data['submission_id'] in backup_ids